@@ -6,6 +6,8 @@ import os
 from dotenv import load_dotenv
 from psycopg2 import extras
 from measurements import populate_measure_industry_year, populate_measure_company_year
+from query_cache import bump_load_generation, lock_loads
+from sketches import DistributionSketches, create_sketch_lookups, load_sketches
 
 # Load the environment variables from .env file
 load_dotenv()
@@ -21,71 +23,123 @@ DB_PARAMS = {
 
 CSV_PATH = "./data_staging/Staged_data.csv"
 
+FACT_CHUNK_SIZE = 10000  # modify to get different performance / memory usage
 
-def populate_job_posting_dimension():
+# Names of the dimension caches, see create_dimension_caches()
+DIMENSIONS = [
+    "job_posting",
+    "company_profile",
+    "job_posting_date",
+    "benefits",
+    "company_hq_location",
+    "job_location",
+]
+
+
+def read_staged_rows(csv_path: str = None):
     """
-    Populate the job posting dimensional table in the database.
+    Iterate through the rows of the staged CSV dataset file.
+
+    Args:
+        csv_path: path of the staged CSV dataset file, CSV_PATH by default
+
+    Returns:
+        A generator of rows, as dictionaries keyed by column name.
     """
+    with open(csv_path or CSV_PATH, newline="", encoding="utf-8-sig") as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            yield row
 
-    # Define SQL query
-    sql_query = """
-    INSERT INTO job_posting_dim (
-        job_id, job_title, qualifications, specialization, job_portal, skills, responsibilities, 
-        minimum_salary, maximum_salary, minimum_experience, maximum_experience, 
-        work_type, gender_preference
-    )
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    ON CONFLICT (job_id) DO NOTHING;
+
+def insert_batch(sql_query: str, data_batch: list[tuple], conn=None):
     """
+    Insert a batch of rows in the database.
 
-    conn = None
+    Args:
+        sql_query: the parameterized INSERT query
+        data_batch: the parameters of each row to insert
+        conn: an open database connection to use instead of a new one. The
+            caller is then responsible for committing and for handling errors.
+    """
+    own_conn = conn is None
     cursor = None
 
     try:
-        conn = psycopg2.connect(**DB_PARAMS)
+        if own_conn:
+            conn = psycopg2.connect(**DB_PARAMS)
         cursor = conn.cursor()
 
-        # Batch data for insertion
-        data_batch = []
-
-        with open(CSV_PATH, newline="", encoding="utf-8-sig") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                data_batch.append(
-                    (
-                        int(row["Job Id"]),
-                        row["Job Title"],
-                        row["Qualifications"],
-                        row["Specialization"],
-                        row["Job Portal"],
-                        row["Skills"],
-                        row["Responsibilities"],
-                        int(row["Minimum Salary"]),
-                        int(row["Maximum Salary"]),
-                        int(row["Minimum Experience (years)"]),
-                        int(row["Maximum Experience (years)"]),
-                        row["Work Type"],
-                        row["Gender Preference"],
-                    )
-                )
-
         # Use execute_batch for more efficient batch inserts
         extras.execute_batch(
             cur=cursor, sql=sql_query, argslist=data_batch, page_size=10000
         )  # modify page_size to get different performance / memory usage
 
-        conn.commit()
+        if own_conn:
+            conn.commit()
     except psycopg2.Error as err:
+        if not own_conn:
+            raise
         print(f"Database error: {err}")
     finally:
-        if conn:
+        if cursor:
             cursor.close()
+        if own_conn and conn:
             conn.close()
 
 
-def populate_company_profile_dimension():
+def populate_job_posting_dimension(rows: list[dict] = None, conn=None):
+    """
+    Populate the job posting dimensional table in the database.
+
+    Args:
+        rows: staged rows to insert, the rows of CSV_PATH by default
+        conn: an open database connection, see insert_batch()
+    """
+
+    # Define SQL query
+    sql_query = """
+    INSERT INTO job_posting_dim (
+        job_id, job_title, qualifications, specialization, job_portal, skills, responsibilities, 
+        minimum_salary, maximum_salary, minimum_experience, maximum_experience, 
+        work_type, gender_preference
+    )
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (job_id) DO NOTHING;
+    """
+
+    # Batch data for insertion
+    data_batch = []
+
+    for row in rows if rows is not None else read_staged_rows():
+        data_batch.append(
+            (
+                int(row["Job Id"]),
+                row["Job Title"],
+                row["Qualifications"],
+                row["Specialization"],
+                row["Job Portal"],
+                row["Skills"],
+                row["Responsibilities"],
+                int(row["Minimum Salary"]),
+                int(row["Maximum Salary"]),
+                int(row["Minimum Experience (years)"]),
+                int(row["Maximum Experience (years)"]),
+                row["Work Type"],
+                row["Gender Preference"],
+            )
+        )
+
+    insert_batch(sql_query, data_batch, conn)
+
+
+def populate_company_profile_dimension(rows: list[dict] = None, conn=None):
     """
     Populate the company profile dimensional table in the database.
+
+    Args:
+        rows: staged rows to insert, the rows of CSV_PATH by default
+        conn: an open database connection, see insert_batch()
     """
 
     # Define SQL query
@@ -97,46 +151,30 @@ def populate_company_profile_dimension():
     ON CONFLICT (name, sector, industry, size, ticker) DO NOTHING;
     """
 
-    conn = None
-    cursor = None
-
-    try:
-        conn = psycopg2.connect(**DB_PARAMS)
-        cursor = conn.cursor()
+    # Batch data for insertion
+    data_batch = []
+
+    for row in rows if rows is not None else read_staged_rows():
+        data_batch.append(
+            (
+                row["Company"],
+                row["Company Sector"],
+                row["Company Industry"],
+                int(row["Company Size"]),
+                row["Company Ticker"],
+            )
+        )
 
-        # Batch data for insertion
-        data_batch = []
-
-        with open(CSV_PATH, newline="", encoding="utf-8-sig") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                data_batch.append(
-                    (
-                        row["Company"],
-                        row["Company Sector"],
-                        row["Company Industry"],
-                        int(row["Company Size"]),
-                        row["Company Ticker"],
-                    )
-                )
+    insert_batch(sql_query, data_batch, conn)
 
-        # Use execute_batch for more efficient batch inserts
-        extras.execute_batch(
-            cur=cursor, sql=sql_query, argslist=data_batch, page_size=10000
-        )  # modify page_size to get different performance / memory usage
 
-        conn.commit()
-    except psycopg2.Error as err:
-        print(f"Database error: {err}")
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()
-
-
-def populate_job_posting_date_dimension():
+def populate_job_posting_date_dimension(rows: list[dict] = None, conn=None):
     """
     Populate the job posting date dimensional table in the database.
+
+    Args:
+        rows: staged rows to insert, the rows of CSV_PATH by default
+        conn: an open database connection, see insert_batch()
     """
     # Define SQL query
     sql_query = """
@@ -147,44 +185,28 @@ def populate_job_posting_date_dimension():
     ON CONFLICT (day, month, year) DO NOTHING;
     """
 
-    conn = None
-    cursor = None
-
-    try:
-        conn = psycopg2.connect(**DB_PARAMS)
-        cursor = conn.cursor()
+    # Batch data for insertion
+    data_batch = []
 
-        # Batch data for insertion
-        data_batch = []
-
-        with open(CSV_PATH, newline="", encoding="utf-8-sig") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                data_batch.append(
-                    (
-                        int(row["Day"]),
-                        int(row["Month"]),
-                        int(row["Year"]),
-                    )
-                )
-
-        # Use execute_batch for more efficient batch inserts
-        extras.execute_batch(
-            cur=cursor, sql=sql_query, argslist=data_batch, page_size=10000
-        )  # modify page_size to get different performance / memory usage
+    for row in rows if rows is not None else read_staged_rows():
+        data_batch.append(
+            (
+                int(row["Day"]),
+                int(row["Month"]),
+                int(row["Year"]),
+            )
+        )
 
-        conn.commit()
-    except psycopg2.Error as err:
-        print(f"Database error: {err}")
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()
+    insert_batch(sql_query, data_batch, conn)
 
 
-def populate_benefits_dimension():
+def populate_benefits_dimension(rows: list[dict] = None, conn=None):
     """
     Populate the benefits dimensional table in the database.
+
+    Args:
+        rows: staged rows to insert, the rows of CSV_PATH by default
+        conn: an open database connection, see insert_batch()
     """
     # Define SQL query
     sql_query = """
@@ -197,50 +219,37 @@ def populate_benefits_dimension():
     ON CONFLICT (retirement_plans, stock_options_or_equity_grants, parental_leave, paid_time_off, flexible_work_arrangements, health_insurance, life_and_disability_insurance, employee_assistance_program, health_and_wellness_facilities, employee_referral_program, transportation_benefits, bonuses_and_incentive_programs) DO NOTHING;
     """
 
-    try:
-        conn = psycopg2.connect(**DB_PARAMS)
-        cursor = conn.cursor()
-
-        # Batch data for insertion
-        data_batch = []
-
-        with open(CSV_PATH, newline="", encoding="utf-8-sig") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                data_batch.append(
-                    (
-                        row["Retirement Plans"],
-                        row["Stock Options or Equity Grants"],
-                        row["Parental Leave"],
-                        row["Paid Time Off (PTO)"],
-                        row["Flexible Work Arrangements"],
-                        row["Health Insurance"],
-                        row["Life and Disability Insurance"],
-                        row["Employee Assistance Program"],
-                        row["Health and Wellness Facilities"],
-                        row["Employee Referral Program"],
-                        row["Transportation Benefits"],
-                        row["Bonuses and Incentive Programs"],
-                    )
-                )
-
-        # Use execute_batch for more efficient batch inserts
-        extras.execute_batch(
-            cur=cursor, sql=sql_query, argslist=data_batch, page_size=10000
+    # Batch data for insertion
+    data_batch = []
+
+    for row in rows if rows is not None else read_staged_rows():
+        data_batch.append(
+            (
+                row["Retirement Plans"],
+                row["Stock Options or Equity Grants"],
+                row["Parental Leave"],
+                row["Paid Time Off (PTO)"],
+                row["Flexible Work Arrangements"],
+                row["Health Insurance"],
+                row["Life and Disability Insurance"],
+                row["Employee Assistance Program"],
+                row["Health and Wellness Facilities"],
+                row["Employee Referral Program"],
+                row["Transportation Benefits"],
+                row["Bonuses and Incentive Programs"],
+            )
         )
 
-        conn.commit()
-    except psycopg2.Error as err:
-        print(f"Database error: {err}")
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()
+    insert_batch(sql_query, data_batch, conn)
 
 
-def populate_company_hq_location_dimension():
+def populate_company_hq_location_dimension(rows: list[dict] = None, conn=None):
     """
     Populate the company HQ location dimensional table in the database.
+
+    Args:
+        rows: staged rows to insert, the rows of CSV_PATH by default
+        conn: an open database connection, see insert_batch()
     """
     # Define SQL query
     sql_query = """
@@ -251,44 +260,27 @@ def populate_company_hq_location_dimension():
     ON CONFLICT (country, city) DO NOTHING;
     """
 
-    conn = None
-    cursor = None
-
-    try:
-        conn = psycopg2.connect(**DB_PARAMS)
-        cursor = conn.cursor()
+    # Batch data for insertion
+    data_batch = []
 
-        # Batch data for insertion
-        data_batch = []
-
-        with open(CSV_PATH, newline="", encoding="utf-8-sig") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                # print(f"{row['Company HQ City']} ......... {str(row['Company HQ City'])}")
-                data_batch.append(
-                    (
-                        row["Company HQ Country"],
-                        row["Company HQ City"],
-                    )
-                )
+    for row in rows if rows is not None else read_staged_rows():
+        data_batch.append(
+            (
+                row["Company HQ Country"],
+                row["Company HQ City"],
+            )
+        )
 
-        # Use execute_batch for more efficient batch inserts
-        extras.execute_batch(
-            cur=cursor, sql=sql_query, argslist=data_batch, page_size=10000
-        )  # modify page_size to get different performance / memory usage
+    insert_batch(sql_query, data_batch, conn)
 
-        conn.commit()
-    except psycopg2.Error as err:
-        print(f"Database error: {err}")
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()
 
-
-def populate_job_location_dimension():
+def populate_job_location_dimension(rows: list[dict] = None, conn=None):
     """
     Populate the job location dimensional table in the database.
+
+    Args:
+        rows: staged rows to insert, the rows of CSV_PATH by default
+        conn: an open database connection, see insert_batch()
     """
     # Define SQL query
     sql_query = """
@@ -299,42 +291,22 @@ def populate_job_location_dimension():
     ON CONFLICT (country, city) DO NOTHING;
     """
 
-    conn = None
-    cursor = None
-
-    try:
-        conn = psycopg2.connect(**DB_PARAMS)
-        cursor = conn.cursor()
-
-        # Batch data for insertion
-        data_batch = []
-
-        with open(CSV_PATH, newline="", encoding="utf-8-sig") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                data_batch.append(
-                    (
-                        row["Country"],
-                        row["City"],
-                        int(row["Job City Population"]),
-                    )
-                )
+    # Batch data for insertion
+    data_batch = []
 
-        # Use execute_batch for more efficient batch inserts
-        extras.execute_batch(
-            cur=cursor, sql=sql_query, argslist=data_batch, page_size=10000
-        )  # modify page_size to get different performance / memory usage
+    for row in rows if rows is not None else read_staged_rows():
+        data_batch.append(
+            (
+                row["Country"],
+                row["City"],
+                int(row["Job City Population"]),
+            )
+        )
 
-        conn.commit()
-    except psycopg2.Error as err:
-        print(f"Database error: {err}")
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()
+    insert_batch(sql_query, data_batch, conn)
 
 
-def create_dimension_caches() -> dict[str, dict]:
+def create_dimension_caches(conn=None, dimensions: list[str] = None) -> dict[str, dict]:
     """
     Create in-memory caches for all dimension tables.
 
@@ -345,62 +317,74 @@ def create_dimension_caches() -> dict[str, dict]:
     this function fetches the primary key of each row in every dimension
     table and stores them in a dictionary as in-memory caches.
 
+    Args:
+        conn: an open database connection to use instead of a new one
+        dimensions: names of the dimension caches to create, all of them by default
+
     Return:
         The caches dictionary storing primary keys of all dimension tables.
     """
-    conn = psycopg2.connect(**DB_PARAMS)
-    caches = {
-        "job_posting": {},
-        "company_profile": {},
-        "job_posting_date": {},
-        "benefits": {},
-        "company_hq_location": {},
-        "job_location": {},
-    }
-
-    with conn.cursor() as cur:
-        # Cache job_posting_dim keys
-        cur.execute("SELECT job_id FROM job_posting_dim;")
-        for key in cur.fetchall():  # returns a tuplein the format (id,)
-            caches["job_posting"][key[0]] = key[0]
-
-        # Cache company_profile_dim keys
-        cur.execute(
-            "SELECT name, sector, industry, size, ticker, company_profile_key FROM company_profile_dim;"
-        )
-        for name, sector, industry, size, ticker, key in cur.fetchall():
-            caches["company_profile"][(name, sector, industry, size, ticker)] = key
+    if dimensions is None:
+        dimensions = DIMENSIONS
+    caches = {dimension: {} for dimension in dimensions}
 
-        # Cache job_posting_date_dim keys
-        cur.execute(
-            "SELECT day, month, year, job_posting_date_key FROM job_posting_date_dim;"
-        )
-        for day, month, year, key in cur.fetchall():
-            caches["job_posting_date"][(day, month, year)] = key
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(**DB_PARAMS)
 
-        # Cache benefits_dim keys
-        cur.execute(
-            "SELECT retirement_plans, stock_options_or_equity_grants, parental_leave, paid_time_off, flexible_work_arrangements, health_insurance, life_and_disability_insurance, employee_assistance_program, health_and_wellness_facilities, employee_referral_program, transportation_benefits, bonuses_and_incentive_programs, benefits_key FROM benefits_dim;"
-        )
-        for a, b, c, d, e, f, g, h, i, j, k, l, key in cur.fetchall():
-            caches["benefits"][(a, b, c, d, e, f, g, h, i, j, k, l)] = key
+    try:
+        with conn.cursor() as cur:
+            # Cache job_posting_dim keys
+            if "job_posting" in caches:
+                cur.execute("SELECT job_id FROM job_posting_dim;")
+                for key in cur.fetchall():  # returns a tuplein the format (id,)
+                    caches["job_posting"][key[0]] = key[0]
+
+            # Cache company_profile_dim keys
+            if "company_profile" in caches:
+                cur.execute(
+                    "SELECT name, sector, industry, size, ticker, company_profile_key FROM company_profile_dim;"
+                )
+                for name, sector, industry, size, ticker, key in cur.fetchall():
+                    caches["company_profile"][(name, sector, industry, size, ticker)] = key
 
-        # Cache company_hq_location_dim keys
-        cur.execute(
-            "SELECT country, city, company_hq_location_key FROM company_hq_location_dim;"
-        )
-        for country, city, key in cur.fetchall():
-            caches["company_hq_location"][(country, city)] = key
+            # Cache job_posting_date_dim keys
+            if "job_posting_date" in caches:
+                cur.execute(
+                    "SELECT day, month, year, job_posting_date_key FROM job_posting_date_dim;"
+                )
+                for day, month, year, key in cur.fetchall():
+                    caches["job_posting_date"][(day, month, year)] = key
+
+            # Cache benefits_dim keys
+            if "benefits" in caches:
+                cur.execute(
+                    "SELECT retirement_plans, stock_options_or_equity_grants, parental_leave, paid_time_off, flexible_work_arrangements, health_insurance, life_and_disability_insurance, employee_assistance_program, health_and_wellness_facilities, employee_referral_program, transportation_benefits, bonuses_and_incentive_programs, benefits_key FROM benefits_dim;"
+                )
+                for a, b, c, d, e, f, g, h, i, j, k, l, key in cur.fetchall():
+                    caches["benefits"][(a, b, c, d, e, f, g, h, i, j, k, l)] = key
 
-        # Cache job_location_dim keys
-        cur.execute("SELECT country, city, job_location_key FROM job_location_dim;")
-        for country, city, key in cur.fetchall():
-            caches["job_location"][(country, city)] = key
+            # Cache company_hq_location_dim keys
+            if "company_hq_location" in caches:
+                cur.execute(
+                    "SELECT country, city, company_hq_location_key FROM company_hq_location_dim;"
+                )
+                for country, city, key in cur.fetchall():
+                    caches["company_hq_location"][(country, city)] = key
+
+            # Cache job_location_dim keys
+            if "job_location" in caches:
+                cur.execute("SELECT country, city, job_location_key FROM job_location_dim;")
+                for country, city, key in cur.fetchall():
+                    caches["job_location"][(country, city)] = key
+    finally:
+        if own_conn:
+            conn.close()
 
     return caches
 
 
-def prepare_data_for_fact_table_insertion(caches: dict[str, dict]):
+def prepare_data_for_fact_table_insertion(caches: dict[str, dict], rows: list[dict] = None):
     """
     Fetch keys from cache for fact table insertion.
 
@@ -413,6 +397,7 @@ def prepare_data_for_fact_table_insertion(caches: dict[str, dict]):
 
     Args:
         caches: a dictionary of dimension tables and their primary keys
+        rows: staged rows to prepare, the rows of CSV_PATH by default
 
     Returns:
         All rows to be inserted in the fact table.
@@ -420,76 +405,82 @@ def prepare_data_for_fact_table_insertion(caches: dict[str, dict]):
 
     data_for_insertion: list[tuple] = []
 
-    with open(CSV_PATH, "r", newline="", encoding="utf-8-sig") as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            # Directly use job_id as a foreign key if it's a primary key in job_posting_dim
-            job_posting_key = caches["job_posting"].get((int(row["Job Id"])))
-
-            # Fetch other foreign keys from cache
-            company_profile_key = caches["company_profile"].get(
-                (
-                    row["Company"],
-                    row["Company Sector"],
-                    row["Company Industry"],
-                    int(row["Company Size"]),
-                    row["Company Ticker"],
-                )
-            )
-
-            job_posting_date_key = caches["job_posting_date"].get(
-                (int(row["Day"]), int(row["Month"]), int(row["Year"]))
+    if rows is None:
+        rows = read_staged_rows()
+
+    for row in rows:
+        # Directly use job_id as a foreign key if it's a primary key in job_posting_dim
+        job_posting_key = caches["job_posting"].get((int(row["Job Id"])))
+
+        # Fetch other foreign keys from cache
+        company_profile_key = caches["company_profile"].get(
+            (
+                row["Company"],
+                row["Company Sector"],
+                row["Company Industry"],
+                int(row["Company Size"]),
+                row["Company Ticker"],
             )
+        )
 
-            # Getting bool values this way for data conversion and matching (Python True is not the same as PostgreSQL True)
-            benefits_key = caches["benefits"].get(
-                (
-                    row["Retirement Plans"].lower() == "true",
-                    row["Stock Options or Equity Grants"].lower() == "true",
-                    row["Parental Leave"].lower() == "true",
-                    row["Paid Time Off (PTO)"].lower() == "true",
-                    row["Flexible Work Arrangements"].lower() == "true",
-                    row["Health Insurance"].lower() == "true",
-                    row["Life and Disability Insurance"].lower() == "true",
-                    row["Employee Assistance Program"].lower() == "true",
-                    row["Health and Wellness Facilities"].lower() == "true",
-                    row["Employee Referral Program"].lower() == "true",
-                    row["Transportation Benefits"].lower() == "true",
-                    row["Bonuses and Incentive Programs"].lower() == "true",
-                )
-            )
+        job_posting_date_key = caches["job_posting_date"].get(
+            (int(row["Day"]), int(row["Month"]), int(row["Year"]))
+        )
 
-            company_hq_location_key = caches["company_hq_location"].get(
-                (row["Company HQ Country"], row["Company HQ City"])
+        # Getting bool values this way for data conversion and matching (Python True is not the same as PostgreSQL True)
+        benefits_key = caches["benefits"].get(
+            (
+                row["Retirement Plans"].lower() == "true",
+                row["Stock Options or Equity Grants"].lower() == "true",
+                row["Parental Leave"].lower() == "true",
+                row["Paid Time Off (PTO)"].lower() == "true",
+                row["Flexible Work Arrangements"].lower() == "true",
+                row["Health Insurance"].lower() == "true",
+                row["Life and Disability Insurance"].lower() == "true",
+                row["Employee Assistance Program"].lower() == "true",
+                row["Health and Wellness Facilities"].lower() == "true",
+                row["Employee Referral Program"].lower() == "true",
+                row["Transportation Benefits"].lower() == "true",
+                row["Bonuses and Incentive Programs"].lower() == "true",
             )
+        )
 
-            job_location_key = caches["job_location"].get((row["Country"], row["City"]))
+        company_hq_location_key = caches["company_hq_location"].get(
+            (row["Company HQ Country"], row["Company HQ City"])
+        )
 
-            if all(
-                [
+        job_location_key = caches["job_location"].get((row["Country"], row["City"]))
+
+        if all(
+            [
+                job_posting_key,
+                company_profile_key,
+                job_posting_date_key,
+                benefits_key,
+                company_hq_location_key,
+                job_location_key,
+            ]
+        ):
+            data_for_insertion.append(
+                (
                     job_posting_key,
                     company_profile_key,
                     job_posting_date_key,
                     benefits_key,
                     company_hq_location_key,
                     job_location_key,
-                ]
-            ):
-                data_for_insertion.append(
-                    (
-                        job_posting_key,
-                        company_profile_key,
-                        job_posting_date_key,
-                        benefits_key,
-                        company_hq_location_key,
-                        job_location_key,
-                    )
                 )
+            )
 
     return data_for_insertion
 
 
-def populate_fact_table(data_for_insertion: list[tuple]):
+def populate_fact_table(
+    data_for_insertion: list[tuple],
+    sketches: DistributionSketches = None,
+    lookups: dict[str, dict] = None,
+    conn=None,
+) -> int:
     """
     Populate the job posting fact table in the database using bulk insert.
 
@@ -502,23 +493,52 @@ def populate_fact_table(data_for_insertion: list[tuple]):
     and primary key of the country "Canada" and link those primary
     keys to a record in the fact table.
 
+    Rows are inserted in chunks of FACT_CHUNK_SIZE. When sketches are given,
+    the rows actually inserted by each chunk (i.e. not already in the fact
+    table) are added to the salary and experience distributions.
+
     Args:
         data_for_insertion: data prepared for insertion into the fact table
+        sketches: distributions to update incrementally, if any
+        lookups: dimension attributes of the fact rows, see create_sketch_lookups()
+        conn: an open database connection to use instead of a new one. The
+            caller is then responsible for committing the transaction.
+
+    Returns:
+        The number of rows inserted in the fact table.
     """
-    conn = psycopg2.connect(**DB_PARAMS)
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(**DB_PARAMS)
+    inserted_count = 0
 
     insert_query = """
     INSERT INTO job_posting_fact (
         job_posting_key, company_profile_key, job_posting_date_key, benefits_key, 
         company_hq_location_key, job_location_key
     )
-    VALUES (%s, %s, %s, %s, %s, %s)
-    ON CONFLICT (job_posting_key, company_profile_key, job_posting_date_key, benefits_key, company_hq_location_key, job_location_key) DO NOTHING;
+    VALUES %s
+    ON CONFLICT (job_posting_key, company_profile_key, job_posting_date_key, benefits_key, company_hq_location_key, job_location_key) DO NOTHING
+    RETURNING job_posting_key, company_profile_key, job_posting_date_key, benefits_key, company_hq_location_key, job_location_key;
     """
 
-    with conn.cursor() as cur:
-        extras.execute_batch(cur, insert_query, data_for_insertion, page_size=10000)
-        conn.commit()
+    try:
+        with conn.cursor() as cur:
+            for start in range(0, len(data_for_insertion), FACT_CHUNK_SIZE):
+                chunk = data_for_insertion[start : start + FACT_CHUNK_SIZE]
+                inserted_rows = extras.execute_values(
+                    cur, insert_query, chunk, page_size=FACT_CHUNK_SIZE, fetch=True
+                )
+                inserted_count += len(inserted_rows)
+                if sketches is not None:
+                    sketches.update_from_fact_rows(inserted_rows, lookups)
+            if own_conn:
+                conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+
+    return inserted_count
 
 
 def populate_database():
@@ -565,25 +585,46 @@ def populate_database():
     # --------------------------------------------------------
     print(f"[+] Populate fact table...")
     stopwatch = time.time()
-    caches: dict[str, dict] = create_dimension_caches()
-    print(f"Done with caching")
-    data_for_insertion: list[tuple] = prepare_data_for_fact_table_insertion(caches)
-    print(f"Done preparing data for fact table insertion")
-    populate_fact_table(data_for_insertion)
-    print(f"Done populating fact table")
-    print(get_elapsed_time_message(stopwatch))
 
-    # --------------------------------------------------------
-    print(f"Populating jobs per industry and year measure")
-    stopwatch = time.time()
-    populate_measure_industry_year()
-    print(get_elapsed_time_message(stopwatch))
+    # The fact table, its measures and the load generation are committed in a single
+    # transaction, so the saved sketches never miss committed fact rows
+    conn = psycopg2.connect(**DB_PARAMS)
+    try:
+        # Wait for the ingest service to commit its batch, so that the sketches loaded
+        # below stay up to date with the database until this transaction is committed
+        lock_loads(conn)
+        caches: dict[str, dict] = create_dimension_caches(conn)
+        print(f"Done with caching")
+        sketches: DistributionSketches = load_sketches(conn)
+        lookups: dict[str, dict] = create_sketch_lookups(caches, conn)
+        print(f"Done loading salary and experience sketches")
+        data_for_insertion: list[tuple] = prepare_data_for_fact_table_insertion(caches)
+        print(f"Done preparing data for fact table insertion")
+        populate_fact_table(data_for_insertion, sketches, lookups, conn)
+        print(f"Done populating fact table")
+        print(get_elapsed_time_message(stopwatch))
+
+        # --------------------------------------------------------
+        print(f"Populating jobs per industry and year measure")
+        stopwatch = time.time()
+        populate_measure_industry_year(conn)
+        print(get_elapsed_time_message(stopwatch))
+
+        # --------------------------------------------------------
+        print(f"Populating jobs per company and year measure")
+        stopwatch = time.time()
+        populate_measure_company_year(conn)
+        print(get_elapsed_time_message(stopwatch))
+
+        # --------------------------------------------------------
+        # Commits the whole transaction and invalidates the cached dashboard queries
+        generation = bump_load_generation(conn)
+        print(f"Load generation is now {generation}")
+    finally:
+        conn.close()
 
-    # --------------------------------------------------------
-    print(f"Populating jobs per company and year measure")
-    stopwatch = time.time()
-    populate_measure_company_year()
-    print(get_elapsed_time_message(stopwatch))
+    sketches.save(generation)
+    print(f"Saved salary and experience sketches")
 
     # --------------------------------------------------------
     print("[+] Successfully populated all tables in the database")
@@ -0,0 +1,623 @@
+import argparse
+import csv
+import json
+import os
+import queue
+import random
+import shutil
+import threading
+import time
+import psycopg2
+
+from collections import deque
+from datetime import date, timedelta
+from psycopg2 import pool
+from db import (
+    DB_PARAMS,
+    DIMENSIONS,
+    create_dimension_caches,
+    populate_benefits_dimension,
+    populate_company_hq_location_dimension,
+    populate_company_profile_dimension,
+    populate_fact_table,
+    populate_job_location_dimension,
+    populate_job_posting_date_dimension,
+    populate_job_posting_dimension,
+    prepare_data_for_fact_table_insertion,
+)
+from measurements import populate_measure_industry_year, populate_measure_company_year
+from query_cache import bump_load_generation, get_load_generation, lock_loads
+from sketches import create_sketch_lookups, load_sketches
+from staging import (
+    BENEFIT_COLUMNS,
+    load_city_populations,
+    load_company_information,
+    stage_rows,
+)
+
+LANDING_DIR = "./data_staging/landing"
+
+# Subdirectories of the landing directory where drops are moved once loaded
+PROCESSED_DIR = "processed"
+FAILED_DIR = "failed"
+
+# Errors of the database itself rather than of a drop (e.g. the database was restarted, a
+# deadlock with a concurrent load), the batch is retried until the database is back
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, pool.PoolError)
+
+# Seconds to wait before retrying a batch after a transient error, doubled after each retry
+RETRY_DELAY_SECONDS = 1.0
+MAX_RETRY_DELAY_SECONDS = 60.0
+
+
+class IngestService:
+    """
+    Long-running service loading raw job_descriptions.csv drops into the data mart.
+
+    Every CSV file appearing in the landing directory is a micro-batch. The
+    watcher thread queues new files, a staging thread applies the transformations
+    of the data staging notebook, and a loader thread inserts each batch in one
+    transaction over a persistent connection pool, reusing warm caches of the
+    dimension keys. Both queues are bounded, so a slow database holds back the
+    watcher instead of piling up staged batches in memory.
+
+    Drops are staged and loaded one at a time in the order they were detected,
+    since the first drop inserting a job posting wins (ON CONFLICT DO NOTHING).
+
+    Loaded drops are moved to the processed/ subdirectory, and drops that
+    could not be staged or whose data was rejected by the database to the
+    failed/ subdirectory, with a timestamp suffix so that drops with the same
+    name do not overwrite each other. When the database itself is unavailable,
+    the batch is retried with an exponential backoff and its drop stays in
+    the landing directory.
+    """
+
+    def __init__(
+        self,
+        landing_dir: str = LANDING_DIR,
+        max_queued_batches: int = 4,
+        pool_size: int = 2,
+        poll_interval: float = 1.0,
+        settle_seconds: float = 2.0,
+        db_params: dict = None,
+    ):
+        """
+        Args:
+            landing_dir: directory watched for new drops
+            max_queued_batches: maximum number of drops waiting to be staged, and
+                of staged batches waiting to be loaded
+            pool_size: maximum number of database connections
+            poll_interval: seconds between two scans of the landing directory
+            settle_seconds: seconds a drop must be left unmodified before it is
+                picked up, so that files still being copied are not read
+            db_params: database connection parameters, DB_PARAMS by default
+        """
+        self.landing_dir = landing_dir
+        self.pool_size = pool_size
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.db_params = db_params if db_params is not None else DB_PARAMS
+
+        self._files: queue.Queue = queue.Queue(maxsize=max_queued_batches)
+        self._batches: queue.Queue = queue.Queue(maxsize=max_queued_batches)
+        self._queued_files: set[str] = set()
+        self._queued_files_lock = threading.Lock()
+        # Loaded drops that could not be moved to processed/ yet, never to be loaded again
+        self._loaded_files: set[str] = set()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+        self._pool: pool.ThreadedConnectionPool = None
+        self._populations: dict[tuple, int] = None
+        self._companies: dict[str, tuple] = None
+        self._caches: dict[str, dict] = None
+        self._sketches = None
+        self._sketches_generation: int = None  # load generation the sketches are up to date with
+        self._metrics: deque[dict] = deque(maxlen=1000)
+
+        for directory in (landing_dir, self._path(PROCESSED_DIR), self._path(FAILED_DIR)):
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, *parts: str) -> str:
+        return os.path.join(self.landing_dir, *parts)
+
+    # --------------------------------------------------------
+    # Lifecycle
+
+    def open(self):
+        """
+        Open the connection pool and load the lookup data used for staging.
+        """
+        if self._pool is None:
+            self._pool = pool.ThreadedConnectionPool(1, self.pool_size, **self.db_params)
+        self._populations = load_city_populations()
+        self._companies = load_company_information()
+
+    def close(self):
+        """
+        Close all the connections of the pool.
+        """
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+    def start(self):
+        """
+        Start watching the landing directory in background threads.
+        """
+        self.open()
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._watch, name="watcher", daemon=True),
+            threading.Thread(target=self._stage_files, name="stager", daemon=True),
+            threading.Thread(target=self._load_batches, name="loader", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        print(f"[+] Watching {self.landing_dir} for job posting drops")
+
+    def stop(self):
+        """
+        Stop the background threads once the batch being loaded is committed.
+
+        Drops that were not loaded yet stay in the landing directory and are
+        picked up when the service is started again.
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.close()
+        print(f"[+] Stopped ingest service")
+
+    def run_forever(self):
+        """
+        Run the service until interrupted with Ctrl+C.
+        """
+        self.start()
+        try:
+            while True:
+                time.sleep(60)
+                print(f"Ingest metrics: {self.metrics_summary()}")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def process_pending(self):
+        """
+        Load every drop currently in the landing directory, one after the other, then return.
+        """
+        self.open()
+        try:
+            for path in self._pending_files(settled_only=False):
+                detected_at = time.time()
+                try:
+                    batch = self._stage(path, detected_at)
+                except Exception as err:  # only this drop failed, go on with the next ones
+                    print(f"Error while staging {path}: {err}")
+                    self._fail(path)
+                    continue
+                if batch is not None:
+                    self._load_with_retries(batch)
+        finally:
+            self.close()
+
+    # --------------------------------------------------------
+    # Pipeline threads
+
+    def _pending_files(self, settled_only: bool = True) -> list[str]:
+        now = time.time()
+        pending = []
+        for file_name in sorted(os.listdir(self.landing_dir)):
+            path = self._path(file_name)
+            if not file_name.endswith(".csv") or not os.path.isfile(path):
+                continue
+            if settled_only and now - os.path.getmtime(path) < self.settle_seconds:
+                continue
+            pending.append(path)
+        return pending
+
+    def _watch(self):
+        while not self._stop.is_set():
+            with self._queued_files_lock:
+                loaded_files = list(self._loaded_files)
+            for path in loaded_files:
+                self._move_loaded(path)
+
+            for path in self._pending_files():
+                with self._queued_files_lock:
+                    if path in self._queued_files:
+                        continue
+                    self._queued_files.add(path)
+                if not self._put(self._files, (path, time.time())):
+                    with self._queued_files_lock:
+                        self._queued_files.discard(path)
+                    break
+            self._stop.wait(self.poll_interval)
+
+    def _stage_files(self):
+        while not self._stop.is_set():
+            item = self._get(self._files)
+            if item is None:
+                continue
+            try:
+                batch = self._stage(*item)
+            except Exception as err:  # keep the service running, only this drop failed
+                print(f"Error while staging {item[0]}: {err}")
+                self._fail(item[0])
+                continue
+            if batch is not None and not self._put(self._batches, batch):
+                self._forget(item[0])  # stopping, the drop will be picked up on restart
+
+    def _load_batches(self):
+        # Batches are loaded by a single thread, in order, to keep the dimension caches consistent
+        while not self._stop.is_set():
+            batch = self._get(self._batches)
+            if batch is not None:
+                self._load_with_retries(batch)
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        # Block while the queue is full, unless the service is stopping
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        try:
+            return q.get(timeout=self.poll_interval)
+        except queue.Empty:
+            return None
+
+    def _forget(self, path: str):
+        with self._queued_files_lock:
+            self._queued_files.discard(path)
+
+    def _move(self, path: str, subdirectory: str):
+        # Periodic drops usually share the same name, keep each of them
+        name, extension = os.path.splitext(os.path.basename(path))
+        suffix = time.strftime("%Y%m%d%H%M%S")
+        destination = self._path(subdirectory, f"{name}_{suffix}{extension}")
+        counter = 1
+        while os.path.exists(destination):
+            destination = self._path(subdirectory, f"{name}_{suffix}_{counter}{extension}")
+            counter += 1
+        shutil.move(path, destination)
+        self._forget(path)
+
+    def _fail(self, path: str):
+        try:
+            self._move(path, FAILED_DIR)
+        except OSError as err:
+            print(f"Could not move {path} to {FAILED_DIR}/: {err}")
+            self._forget(path)
+
+    def _move_loaded(self, path: str):
+        try:
+            self._move(path, PROCESSED_DIR)
+        except FileNotFoundError:
+            self._forget(path)  # moved away by hand
+        except OSError as err:
+            # Keep the drop queued so that the watcher retries the move instead of loading it again
+            print(f"Could not move {path} to {PROCESSED_DIR}/, retrying later: {err}")
+            with self._queued_files_lock:
+                self._loaded_files.add(path)
+            return
+        with self._queued_files_lock:
+            self._loaded_files.discard(path)
+
+    # --------------------------------------------------------
+    # Staging and loading of a batch
+
+    def _stage(self, path: str, detected_at: float) -> dict:
+        """
+        Read and stage a drop.
+
+        Returns:
+            The batch to load, or None if the drop could not be read.
+        """
+        stopwatch = time.time()
+        try:
+            with open(path, newline="", encoding="utf-8-sig") as csvfile:
+                raw_rows = list(csv.DictReader(csvfile))
+        except (OSError, UnicodeDecodeError, csv.Error) as err:
+            print(f"Could not read {path}: {err}")
+            self._fail(path)
+            return None
+
+        rows, rejected = stage_rows(raw_rows, self._populations, self._companies)
+        return {
+            "path": path,
+            "rows": rows,
+            "metrics": {
+                "file": os.path.basename(path),
+                "raw_rows": len(raw_rows),
+                "staged_rows": len(rows),
+                "rejected_rows": rejected,
+                "detected_at": detected_at,
+                "queue_wait_seconds": stopwatch - detected_at,
+                "staging_seconds": time.time() - stopwatch,
+                "staged_at": time.time(),
+            },
+        }
+
+    def _warm_up(self, conn):
+        # Caches are kept across batches, and only rebuilt after a failed batch
+        if self._caches is None:
+            self._caches = create_dimension_caches(conn)
+
+        # Sketches are also reloaded when another loader (e.g. db.py) committed new data
+        generation = get_load_generation(conn)
+        if self._sketches is None or self._sketches_generation != generation:
+            self._sketches = load_sketches(conn)
+            self._sketches_generation = generation
+
+    def _load_with_retries(self, batch: dict):
+        """
+        Load a staged batch, retrying while the database is unavailable.
+
+        The drop is moved to failed/ when the database rejects its data (e.g.
+        DataError, IntegrityError), and left in the landing directory when the
+        service is stopped while waiting to retry.
+        """
+        metrics = batch["metrics"]
+        metrics["queue_wait_seconds"] += time.time() - metrics.pop("staged_at")
+
+        delay = RETRY_DELAY_SECONDS
+        while True:
+            try:
+                self._load(batch)
+                return
+            except TRANSIENT_ERRORS as err:
+                print(
+                    f"Database unavailable while loading {batch['path']}, "
+                    f"retrying in {delay:.0f} seconds: {err}"
+                )
+            except Exception as err:  # keep the service running, only this drop failed
+                print(f"Error while loading {batch['path']}: {err}")
+                self._fail(batch["path"])
+                return
+
+            if self._stop.wait(delay):
+                self._forget(batch["path"])  # stopping, the drop will be picked up on restart
+                return
+            delay = min(2 * delay, MAX_RETRY_DELAY_SECONDS)
+
+    def _load(self, batch: dict):
+        """
+        Load a staged batch in a single transaction and record its metrics.
+
+        Raises:
+            Any error raised while loading, once the transaction is rolled back.
+        """
+        metrics = batch["metrics"]
+        rows = batch["rows"]
+        stopwatch = time.time()
+
+        conn = self._pool.getconn()
+        broken = False
+        try:
+            # Loaders are serialized, so that no other loader commits before the bump below
+            lock_loads(conn)
+            self._warm_up(conn)
+
+            populate_job_posting_dimension(rows, conn)
+            populate_company_profile_dimension(rows, conn)
+            populate_job_posting_date_dimension(rows, conn)
+            populate_benefits_dimension(rows, conn)
+            populate_company_hq_location_dimension(rows, conn)
+            populate_job_location_dimension(rows, conn)
+
+            # Job ids are their own keys, other new dimension rows need their generated keys
+            for row in rows:
+                self._caches["job_posting"][int(row["Job Id"])] = int(row["Job Id"])
+            data_for_insertion = prepare_data_for_fact_table_insertion(self._caches, rows)
+            if len(data_for_insertion) < len(rows):
+                self._caches.update(create_dimension_caches(conn, DIMENSIONS[1:]))
+                data_for_insertion = prepare_data_for_fact_table_insertion(self._caches, rows)
+
+            # Salaries and experiences as stored, the first version of a job posting wins
+            lookups = create_sketch_lookups(
+                self._caches, conn, sorted({int(row["Job Id"]) for row in rows})
+            )
+            metrics["fact_rows"] = populate_fact_table(
+                data_for_insertion, self._sketches, lookups, conn
+            )
+
+            if metrics["fact_rows"]:
+                # Only the partitions of the batch can have new counts
+                populate_measure_industry_year(
+                    conn, sorted({(int(row["Year"]), row["Company Industry"]) for row in rows})
+                )
+                populate_measure_company_year(
+                    conn, sorted({(int(row["Year"]), row["Company"]) for row in rows})
+                )
+
+                # Commits the whole batch
+                self._sketches_generation = bump_load_generation(conn)
+            else:
+                # Nothing new for the dashboards, keep their cached queries
+                conn.commit()
+            metrics["generation"] = self._sketches_generation
+        except Exception as err:
+            # A connection that failed (e.g. the database was restarted) is not reused
+            broken = isinstance(err, TRANSIENT_ERRORS)
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+            # Keys of the rolled back dimension rows and rows added to the sketches are stale
+            self._caches = None
+            self._sketches = None
+            raise
+        finally:
+            self._pool.putconn(conn, close=broken)
+
+        # The batch is committed, a failure to save the sketches only means rebuilding them
+        if metrics["fact_rows"]:
+            try:
+                self._sketches.save(self._sketches_generation)
+            except (OSError, TypeError, ValueError) as err:
+                print(f"Could not save the sketches, they will be rebuilt: {err}")
+                self._sketches = None
+
+        self._move_loaded(batch["path"])
+        metrics["load_seconds"] = time.time() - stopwatch
+        metrics["latency_seconds"] = time.time() - metrics.pop("detected_at")
+        self._metrics.append(metrics)
+        print(
+            f"Loaded {metrics['file']}: {metrics['fact_rows']} fact rows "
+            f"({metrics['rejected_rows']} rejected) in {metrics['load_seconds']:.3f} seconds, "
+            f"{metrics['latency_seconds']:.3f} seconds after it was detected"
+        )
+
+    # --------------------------------------------------------
+    # Metrics
+
+    def metrics(self) -> list[dict]:
+        """
+        Metrics of the most recently loaded batches, oldest first.
+        """
+        return list(self._metrics)
+
+    def metrics_summary(self) -> dict:
+        """
+        Summarize the metrics of the most recently loaded batches.
+
+        Returns:
+            Number of batches and rows loaded, throughput, and the median and
+            95th percentile of the load and end-to-end latencies in seconds.
+        """
+        metrics = list(self._metrics)
+        load_seconds = sum(m["load_seconds"] for m in metrics)
+        fact_rows = sum(m["fact_rows"] for m in metrics)
+        return {
+            "batches": len(metrics),
+            "fact_rows": fact_rows,
+            "rejected_rows": sum(m["rejected_rows"] for m in metrics),
+            "rows_per_second": fact_rows / load_seconds if load_seconds else 0.0,
+            "queued_files": self._files.qsize(),
+            "queued_batches": self._batches.qsize(),
+            "load_seconds": _percentiles([m["load_seconds"] for m in metrics]),
+            "latency_seconds": _percentiles([m["latency_seconds"] for m in metrics]),
+        }
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0}
+    ordered = sorted(values)
+    return {
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+    }
+
+
+def write_synthetic_drop(landing_dir: str = LANDING_DIR, rows: int = 1000, seed: int = None) -> str:
+    """
+    Write a synthetic raw job_descriptions.csv drop, to test the service locally.
+
+    Job locations and companies are drawn from CityPopulation.csv and
+    CompanyInformation.csv so that most rows can be integrated, and some
+    rows are posted in countries outside of our analysis to be filtered out.
+
+    Args:
+        landing_dir: directory where the drop is written
+        rows: number of job postings in the drop
+        seed: seed of the random generator, for reproducible drops
+
+    Returns:
+        The path of the drop.
+    """
+    rng = random.Random(seed)
+    cities = sorted(load_city_populations())
+    companies = sorted(load_company_information())
+    sectors = ["Technology", "Healthcare", "Finance", "Retail", "Energy", "Manufacturing"]
+    columns = [
+        "Job Id", "Experience", "Qualifications", "Salary Range", "location", "Country",
+        "latitude", "longitude", "Work Type", "Company Size", "Job Posting Date", "Preference",
+        "Contact Person", "Contact", "Job Title", "Role", "Job Portal", "Job Description",
+        "Benefits", "skills", "Responsibilities", "Company", "Company Profile",
+    ]
+
+    raw_rows = []
+    for _ in range(rows):
+        city, country = rng.choice(cities)
+        if rng.random() < 0.05:
+            country = "Brazil"  # not in DESIRED_COUNTRIES
+        minimum_salary = rng.randint(55, 90)
+        minimum_experience = rng.randint(0, 5)
+        sector = rng.choice(sectors)
+        raw_rows.append(
+            {
+                "Job Id": rng.getrandbits(52),
+                "Experience": f"{minimum_experience} to {minimum_experience + rng.randint(1, 10)} Years",
+                "Qualifications": rng.choice(["B.Tech", "MBA", "PhD", "BBA", "M.Com"]),
+                "Salary Range": f"${minimum_salary}K-${minimum_salary + rng.randint(5, 40)}K",
+                "location": city,
+                "Country": country,
+                "latitude": 0,
+                "longitude": 0,
+                "Work Type": rng.choice(["Full-Time", "Part-Time", "Intern", "Contract", "Temporary"]),
+                "Company Size": rng.randint(10000, 100000),
+                "Job Posting Date": (date(2021, 1, 1) + timedelta(days=rng.randint(0, 1094))).isoformat(),
+                "Preference": rng.choice(["Both", "Male", "Female"]),
+                "Contact Person": "Synthetic Contact",
+                "Contact": "000-000-0000",
+                "Job Title": rng.choice(["Data Analyst", "Software Engineer", "Accountant", "Nurse"]),
+                "Role": rng.choice(["Data Scientist", "Backend Developer", "Auditor", "Pediatric Nurse"]),
+                "Job Portal": rng.choice(["LinkedIn", "Indeed", "Glassdoor", "Monster"]),
+                "Job Description": "Synthetic job posting",
+                "Benefits": "{'" + ", ".join(rng.sample(BENEFIT_COLUMNS, rng.randint(1, 4))) + "'}",
+                "skills": "Synthetic skills",
+                "Responsibilities": "Synthetic responsibilities",
+                "Company": rng.choice(companies),
+                "Company Profile": json.dumps(
+                    {"Sector": sector, "Industry": sector, "City": city, "Ticker": "SYN"}
+                ),
+            }
+        )
+
+    # Write to a temporary file first so the service never picks up a partial drop
+    path = os.path.join(landing_dir, f"job_descriptions_{time.strftime('%Y%m%d%H%M%S')}_{rng.getrandbits(16)}.csv")
+    with open(f"{path}.tmp", "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(raw_rows)
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load raw job posting drops into the data mart.")
+    parser.add_argument("--landing-dir", default=LANDING_DIR, help="directory watched for new drops")
+    parser.add_argument("--max-queued-batches", type=int, default=4)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--once", action="store_true", help="load the drops already there and exit")
+    parser.add_argument(
+        "--synthetic-drops", type=int, default=0, help="write synthetic drops and exit"
+    )
+    parser.add_argument("--synthetic-rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.synthetic_drops:
+        os.makedirs(args.landing_dir, exist_ok=True)
+        for _ in range(args.synthetic_drops):
+            print(f"Wrote {write_synthetic_drop(args.landing_dir, args.synthetic_rows)}")
+    else:
+        service = IngestService(
+            landing_dir=args.landing_dir,
+            max_queued_batches=args.max_queued_batches,
+            pool_size=args.pool_size,
+            poll_interval=args.poll_interval,
+        )
+        if args.once:
+            service.process_pending()
+            print(f"Ingest metrics: {service.metrics_summary()}")
+        else:
+            service.run_forever()
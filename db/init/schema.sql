@@ -108,3 +108,33 @@ CREATE TABLE job_posting_fact (
     jobs_per_company_and_year BIGINT,
     PRIMARY KEY (job_posting_key, company_profile_key, job_posting_date_key, benefits_key, company_hq_location_key, job_location_key)
 );
+
+-- Load Generation
+-- Incremented by the loader every time the fact table and its measures are committed,
+-- cached dashboard query results from an older generation are stale (see db/query_cache.py)
+CREATE TABLE IF NOT EXISTS load_generation (
+    id INT PRIMARY KEY CHECK (id = 1), -- single row table
+    generation BIGINT NOT NULL,
+    loaded_at TIMESTAMP
+);
+
+INSERT INTO load_generation (id, generation) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+
+-- Create Views
+
+-- Measures of the fact table, refreshed by the loader (see db/measurements.py)
+CREATE VIEW jobs_per_industry_and_year AS
+SELECT D.year, P.job_id, C.industry, COUNT(P.job_id) 
+OVER (Partition by (D.year, C.industry)) AS jobs_per_industry_and_year
+FROM job_posting_date_dim D, job_posting_dim P, company_profile_dim C, job_posting_fact F
+WHERE F.job_posting_key = P.job_id AND 
+F.job_posting_date_key = D.job_posting_date_key AND 
+F.company_profile_key = C.company_profile_key;
+
+CREATE VIEW jobs_per_company_and_year AS
+SELECT D.year, P.job_id, C.name, COUNT(P.job_id) 
+OVER (Partition by (D.year, C.name)) AS jobs_per_company_and_year
+FROM job_posting_date_dim D, job_posting_dim P, company_profile_dim C, job_posting_fact F
+WHERE F.job_posting_key = P.job_id AND 
+F.job_posting_date_key = D.job_posting_date_key
+AND F.company_profile_key = C.company_profile_key;
@@ -2,6 +2,7 @@ import psycopg2
 import os
 
 from dotenv import load_dotenv
+from query_cache import create_load_generation_table
 
 # Load the environment variables from .env file
 load_dotenv()
@@ -16,66 +17,121 @@ DB_PARAMS = {
 }
 
 
-def populate_measure_industry_year():
+# Views of the measures, created once with the schema (see db/init/schema.sql)
+CREATE_VIEWS = """
+    CREATE OR REPLACE VIEW jobs_per_industry_and_year AS
+    SELECT D.year, P.job_id, C.industry, COUNT(P.job_id) 
+    OVER (Partition by (D.year, C.industry)) AS jobs_per_industry_and_year
+    FROM job_posting_date_dim D, job_posting_dim P, company_profile_dim C, job_posting_fact F
+    WHERE F.job_posting_key = P.job_id AND 
+    F.job_posting_date_key = D.job_posting_date_key AND 
+    F.company_profile_key = C.company_profile_key;
+
+    CREATE OR REPLACE VIEW jobs_per_company_and_year AS
+    SELECT D.year, P.job_id, C.name, COUNT(P.job_id) 
+    OVER (Partition by (D.year, C.name)) AS jobs_per_company_and_year
+    FROM job_posting_date_dim D, job_posting_dim P, company_profile_dim C, job_posting_fact F
+    WHERE F.job_posting_key = P.job_id AND 
+    F.job_posting_date_key = D.job_posting_date_key
+    AND F.company_profile_key = C.company_profile_key;
+"""
+
+
+def create_measure_views():
     """
-    Adding measures to the fact table 
-    
-    Populate the jobs_per_industry_and_year column in the fact table
-    with the measured value of 
-    the number of jobs posted in each industry in each year
+    Create the views of the measures in a database created before they were part of the schema.
     """
     conn = psycopg2.connect(**DB_PARAMS)
-    
-    create_view = """
-        CREATE VIEW jobs_per_industry_and_year AS
-        SELECT D.year, P.job_id, C.industry, COUNT(P.job_id) 
-        OVER (Partition by (D.year, C.industry)) AS jobs_per_industry_and_year
-        FROM job_posting_date_dim D, job_posting_dim P, company_profile_dim C, job_posting_fact F
-        WHERE F.job_posting_key = P.job_id AND 
-        F.job_posting_date_key = D.job_posting_date_key AND 
-        F.company_profile_key = C.company_profile_key;
+    try:
+        with conn.cursor() as cur:
+            cur.execute(CREATE_VIEWS)
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def update_measure(measure: str, group_column: str, partitions: list[tuple] = None, conn=None):
+    """
+    Update a measure of the fact table counting the jobs posted per year and group.
+
+    The counts are computed with an aggregate restricted to the given partitions,
+    rather than with a window over the whole fact table, and only the rows whose
+    measure changed are updated, so refreshing the measure after a small load
+    is cheap.
+
+    Args:
+        measure: the column of the fact table holding the measure
+        group_column: the column of company_profile_dim the jobs are grouped by, with the year
+        partitions: the (year, group) partitions to update, all of them by default
+        conn: an open database connection to use instead of a new one. The
+            caller is then responsible for committing the transaction.
     """
-    update_fact = """
+    if partitions is not None and not partitions:
+        return
+
+    partition_filter = f"AND (D.year, C.{group_column}) IN %s" if partitions else ""
+    update_fact = f"""
         UPDATE job_posting_fact AS f
-        SET jobs_per_industry_and_year = v.jobs_per_industry_and_year
-        FROM jobs_per_industry_and_year AS v
-        WHERE f.job_posting_key = v.job_id;
+        SET {measure} = m.{measure}
+        FROM (
+            SELECT D.year, C.{group_column}, COUNT(*) AS {measure}
+            FROM job_posting_fact F, job_posting_date_dim D, company_profile_dim C
+            WHERE F.job_posting_date_key = D.job_posting_date_key AND
+            F.company_profile_key = C.company_profile_key
+            {partition_filter}
+            GROUP BY D.year, C.{group_column}
+        ) AS m, job_posting_date_dim D, company_profile_dim C
+        WHERE f.job_posting_date_key = D.job_posting_date_key AND
+        f.company_profile_key = C.company_profile_key AND
+        D.year = m.year AND C.{group_column} = m.{group_column}
+        AND f.{measure} IS DISTINCT FROM m.{measure};
+    """
+
+    own_conn = conn is None
+    if own_conn:
+        conn = psycopg2.connect(**DB_PARAMS)
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(update_fact, (tuple(partitions),) if partitions else None)
+            if own_conn:
+                conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def populate_measure_industry_year(conn=None, partitions: list[tuple] = None):
     """
+    Adding measures to the fact table 
     
-    with conn.cursor() as cur:
-        cur.execute(create_view)
-        cur.execute(update_fact)
-        conn.commit()
+    Populate the jobs_per_industry_and_year column in the fact table
+    with the measured value of 
+    the number of jobs posted in each industry in each year
+
+    Args:
+        conn: an open database connection, see update_measure()
+        partitions: the (year, industry) partitions to update, all of them by default
+    """
+    update_measure("jobs_per_industry_and_year", "industry", partitions, conn)
 
 
-def populate_measure_company_year():
+def populate_measure_company_year(conn=None, partitions: list[tuple] = None):
     """
     Adding measures to the fact table 
     
     Populate the jobs_per_company_and_year column in the fact table
     with the measured value of 
     the number of jobs a company posted in each year
+
+    Args:
+        conn: an open database connection, see update_measure()
+        partitions: the (year, company name) partitions to update, all of them by default
     """
-    conn = psycopg2.connect(**DB_PARAMS)
-    
-    create_view = """
-        CREATE VIEW jobs_per_company_and_year AS
-        SELECT D.year, P.job_id, C.name, COUNT(P.job_id) 
-        OVER (Partition by (D.year, C.name)) AS jobs_per_company_and_year
-        FROM job_posting_date_dim D, job_posting_dim P, company_profile_dim C, job_posting_fact F
-        WHERE F.job_posting_key = P.job_id AND 
-        F.job_posting_date_key = D.job_posting_date_key
-        AND F.company_profile_key = C.company_profile_key;
-    """
-    update_fact = """
-        UPDATE job_posting_fact AS f
-        SET jobs_per_company_and_year = v.jobs_per_company_and_year
-        FROM jobs_per_company_and_year AS v
-        WHERE f.job_posting_key = v.job_id;
-    """
-    
-    with conn.cursor() as cur:
-        cur.execute(create_view)
-        cur.execute(update_fact)
-        conn.commit()
+    update_measure("jobs_per_company_and_year", "name", partitions, conn)
+
 
+if __name__ == "__main__":
+    # Bring a database created with an older schema up to date, safe to run more than once
+    create_load_generation_table()
+    create_measure_views()
@@ -0,0 +1,486 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+import psycopg2
+
+from collections import OrderedDict, deque
+from typing import Optional
+from dotenv import load_dotenv
+
+# Load the environment variables from .env file
+load_dotenv()
+
+# Define database connection parameters
+DB_PARAMS = {
+    "dbname": "postgres",
+    "user": "postgres",
+    "password": os.getenv("POSTGRES_PASSWORD"),
+    "host": "localhost",
+    "port": "5432",
+}
+
+CACHE_DIR = "./db/.query_cache"
+
+# Key of the advisory lock held by the loaders until they commit, see lock_loads()
+LOAD_LOCK_KEY = 4142
+
+# Same as db/init/schema.sql, for databases created before load_generation was part of the schema
+CREATE_LOAD_GENERATION = """
+    CREATE TABLE IF NOT EXISTS load_generation (
+        id INT PRIMARY KEY CHECK (id = 1),
+        generation BIGINT NOT NULL,
+        loaded_at TIMESTAMP
+    );
+
+    INSERT INTO load_generation (id, generation) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+"""
+
+
+def create_load_generation_table():
+    """
+    Create and seed the load_generation table if it does not exist yet.
+    """
+    conn = psycopg2.connect(**DB_PARAMS)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(CREATE_LOAD_GENERATION)
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def get_load_generation(conn) -> int:
+    """
+    Fetch the current load generation of the data mart.
+
+    The load generation is a counter that the loader increments every time
+    it commits new data into the fact table and its measures. Cached query
+    results tagged with an older generation are stale.
+
+    Only reads the generation, in the current transaction of the connection.
+
+    Args:
+        conn: an open database connection
+
+    Returns:
+        The current load generation.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT generation FROM load_generation WHERE id = 1;")
+        row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def lock_loads(conn):
+    """
+    Wait until no other loader is loading the data mart, and keep it so until the end of the transaction.
+
+    Must be called at the start of the load transaction, before reading the load
+    generation, so that no other loader (db.py or the ingest service) commits
+    between that read and bump_load_generation().
+
+    Args:
+        conn: an open database connection, the lock is released when its transaction ends
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s);", (LOAD_LOCK_KEY,))
+
+
+def bump_load_generation(conn) -> int:
+    """
+    Increment the load generation of the data mart.
+
+    Must be called by the loader once the fact table and the measures are
+    written, and commits the transaction. This invalidates every cached
+    query result.
+
+    Args:
+        conn: an open database connection
+
+    Returns:
+        The new load generation.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE load_generation
+            SET generation = generation + 1, loaded_at = now()
+            WHERE id = 1
+            RETURNING generation;
+            """
+        )
+        generation = cur.fetchone()[0]
+        conn.commit()
+    return generation
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Normalize a SQL query so that trivially different spellings share a cache entry.
+
+    Only the surrounding whitespace and trailing semicolons are dropped.
+    Anything else (case, inner whitespace, comments) may be significant
+    inside string literals, and serving the result of another query is
+    much worse than a cache miss.
+
+    Args:
+        sql: the SQL query to normalize
+
+    Returns:
+        The normalized SQL query.
+    """
+    return sql.strip().rstrip(";").rstrip()
+
+
+def make_cache_key(sql: str, params=None) -> str:
+    """
+    Build the cache key of a query from its normalized SQL and its parameters.
+
+    Args:
+        sql: the SQL query
+        params: the query parameters, as passed to cursor.execute()
+
+    Returns:
+        A hexadecimal digest identifying the query.
+    """
+    payload = repr((normalize_sql(sql), params)).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+class MemoryBackend:
+    """
+    Store cached query results in the memory of the current process.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, bytes] = {}
+
+    def load_index(self) -> list[tuple[str, int]]:
+        return []
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._entries.get(key)
+
+    def set(self, key: str, payload: bytes):
+        self._entries[key] = payload
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def touch(self, key: str):
+        pass
+
+
+class DiskBackend:
+    """
+    Store cached query results as files in a local directory.
+
+    Entries survive restarts of the dashboards, so a fresh process does not
+    have to re-run every aggregation until the next load.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pickle")
+
+    def load_index(self) -> list[tuple[str, int]]:
+        """
+        List the entries already on disk, least recently used first.
+
+        Returns:
+            A list of (key, size in bytes) tuples.
+        """
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(".pickle"):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, file_name))
+            entries.append((stat.st_mtime, file_name[: -len(".pickle")], stat.st_size))
+        return [(key, size) for _, key, size in sorted(entries)]
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, payload: bytes):
+        # Write to a temporary file first so readers never see a partial entry
+        tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, self._path(key))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def touch(self, key: str):
+        # The modification time keeps the LRU order across restarts
+        try:
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class QueryCache:
+    """
+    Cache the results of the dashboard queries run against the data mart.
+
+    Results are keyed on the normalized SQL and its parameters, evicted in
+    least recently used order once the entry count or the total size exceeds
+    its bound, and invalidated as soon as the loader bumps the load generation.
+
+    Example:
+        cache = QueryCache(backend=DiskBackend())
+        rows = cache.execute("SELECT industry, COUNT(*) FROM ... GROUP BY industry;")
+        print(cache.stats())
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        max_entries: int = 1024,
+        max_bytes: int = 256 * 1024 * 1024,
+        generation_check_interval: float = 1.0,
+        db_params: dict = None,
+    ):
+        """
+        Args:
+            backend: where the results are stored, a MemoryBackend by default
+            max_entries: maximum number of cached results
+            max_bytes: maximum total size of the cached results
+            generation_check_interval: seconds between two reads of the load
+                generation, 0 to read it before every query
+            db_params: database connection parameters, DB_PARAMS by default
+        """
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.generation_check_interval = generation_check_interval
+        self.db_params = db_params if db_params is not None else DB_PARAMS
+
+        # One connection per thread, so that a slow query never holds back the others
+        self._local = threading.local()
+        self._connections = []
+        # Guards the generation, the index and the stats, never held while querying
+        self._lock = threading.RLock()
+        self._generation: int = None
+        self._generation_checked_at: float = 0.0
+
+        # key -> size in bytes, ordered from least to most recently used
+        self._index: OrderedDict[str, int] = OrderedDict(self.backend.load_index())
+        self._total_bytes: int = sum(self._index.values())
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._hit_latencies: deque[float] = deque(maxlen=1000)
+        self._miss_latencies: deque[float] = deque(maxlen=1000)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn.closed:
+            conn = psycopg2.connect(**self.db_params)
+            self._local.conn = conn
+            with self._lock:
+                self._connections = [c for c in self._connections if not c.closed]
+                self._connections.append(conn)
+        return conn
+
+    def _rollback(self, conn):
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            # The connection is unusable (e.g. the database restarted), reconnect on next use
+            conn.close()
+
+    def _read_generation(self) -> int:
+        checked_at = time.monotonic()
+        conn = self._connection()
+        try:
+            generation = get_load_generation(conn)
+        finally:
+            self._rollback(conn)  # end the read-only transaction so later reads see new loads
+
+        with self._lock:
+            # Another thread may have read a more recent generation in the meantime
+            if checked_at >= self._generation_checked_at:
+                self._generation = generation
+                self._generation_checked_at = checked_at
+        return generation
+
+    def _current_generation(self) -> int:
+        with self._lock:
+            if (
+                self._generation is not None
+                and time.monotonic() - self._generation_checked_at < self.generation_check_interval
+            ):
+                return self._generation
+        return self._read_generation()
+
+    def execute(self, sql: str, params=None) -> list[tuple]:
+        """
+        Run a query, serving its result from the cache when it is still valid.
+
+        Args:
+            sql: the SQL query
+            params: the query parameters, as passed to cursor.execute()
+
+        Returns:
+            The rows returned by the query.
+        """
+        return self.execute_with_columns(sql, params)[1]
+
+    def execute_with_columns(self, sql: str, params=None) -> tuple[list[str], list[tuple]]:
+        """
+        Same as execute(), but also return the column names of the result.
+
+        Returns:
+            A tuple of the column names and the rows returned by the query.
+        """
+        stopwatch = time.perf_counter()
+        key = make_cache_key(sql, params)
+
+        generation = self._current_generation()
+        with self._lock:
+            entry = self._get(key)
+            if entry is not None and entry[0] != generation:
+                # The loader committed new data since this result was cached
+                self._invalidate()
+                entry = None
+
+            if entry is not None:
+                self._hits += 1
+                self._hit_latencies.append(time.perf_counter() - stopwatch)
+                return entry[1], entry[2]
+
+        conn = self._connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                columns = [column[0] for column in cur.description]
+                rows = cur.fetchall()
+        finally:
+            # Also ends a failed query's transaction, which would block every later query
+            self._rollback(conn)
+
+        # A load may have been committed while the query was running
+        generation_after = self._read_generation()
+        with self._lock:
+            if generation_after == generation:
+                self._set(key, (generation, columns, rows))
+
+            self._misses += 1
+            self._miss_latencies.append(time.perf_counter() - stopwatch)
+        return columns, rows
+
+    def _get(self, key: str):
+        if key not in self._index:
+            return None
+        payload = self.backend.get(key)
+        if payload is None:  # removed from the backend behind our back
+            self._total_bytes -= self._index.pop(key)
+            return None
+        self._index.move_to_end(key)
+        self.backend.touch(key)
+        return pickle.loads(payload)
+
+    def _set(self, key: str, entry: tuple):
+        payload = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_bytes:
+            return  # never fits, caching it would only flush everything else
+
+        if key in self._index:
+            self._total_bytes -= self._index.pop(key)
+        self.backend.set(key, payload)
+        self._index[key] = len(payload)
+        self._total_bytes += len(payload)
+
+        while len(self._index) > self.max_entries or self._total_bytes > self.max_bytes:
+            evicted_key, size = self._index.popitem(last=False)
+            self.backend.delete(evicted_key)
+            self._total_bytes -= size
+            self._evictions += 1
+
+    def _invalidate(self):
+        for key in self._index:
+            self.backend.delete(key)
+        self._index.clear()
+        self._total_bytes = 0
+        self._invalidations += 1
+
+    def clear(self):
+        """
+        Remove every cached result.
+        """
+        with self._lock:
+            self._invalidate()
+
+    def stats(self) -> dict:
+        """
+        Report the effectiveness of the cache.
+
+        Returns:
+            Hit and miss counts, hit rate, evictions, invalidations, current
+            size and the average and 95th percentile latencies (in milliseconds)
+            of the most recent cache hits and misses.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "generation": self._generation,
+                "hit_latency_ms": _summarize_latencies(self._hit_latencies),
+                "miss_latency_ms": _summarize_latencies(self._miss_latencies),
+            }
+
+    def close(self):
+        """
+        Close the database connections used by the cache.
+        """
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+
+def _summarize_latencies(latencies) -> dict:
+    if not latencies:
+        return {"avg": 0.0, "p95": 0.0}
+    ordered = sorted(latencies)
+    return {
+        "avg": 1000 * sum(ordered) / len(ordered),
+        "p95": 1000 * ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+    }
+
+
+if __name__ == "__main__":
+    # Run a typical dashboard aggregation twice to show the effect of the cache
+    cache = QueryCache(backend=DiskBackend())
+    jobs_per_industry_and_year = """
+        SELECT D.year, C.industry, COUNT(*)
+        FROM job_posting_fact F, job_posting_date_dim D, company_profile_dim C
+        WHERE F.job_posting_date_key = D.job_posting_date_key
+        AND F.company_profile_key = C.company_profile_key
+        GROUP BY D.year, C.industry;
+    """
+    for _ in range(2):
+        cache.execute(jobs_per_industry_and_year)
+    print(cache.stats())
+    cache.close()
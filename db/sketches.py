@@ -0,0 +1,580 @@
+import json
+import math
+import os
+import random
+import time
+import psycopg2
+
+from dotenv import load_dotenv
+from query_cache import get_load_generation
+
+# Load the environment variables from .env file
+load_dotenv()
+
+# Define database connection parameters
+DB_PARAMS = {
+    "dbname": "postgres",
+    "user": "postgres",
+    "password": os.getenv("POSTGRES_PASSWORD"),
+    "host": "localhost",
+    "port": "5432",
+}
+
+SKETCH_PATH = "./db/sketches.json"
+
+# Dimension groups for which distributions are maintained, and the attributes forming their key
+GROUPINGS = {
+    "year_industry": ("year", "industry"),
+    "year_country": ("year", "country"),
+    "company": ("company",),
+}
+
+# Columns of job_posting_dim that are summarized, and the bin width of their histograms
+METRICS = {
+    "minimum_salary": 5000,
+    "maximum_salary": 5000,
+    "minimum_experience": 1,
+    "maximum_experience": 1,
+}
+
+# Exact distributions from the database, used to rebuild the sketches and to measure their accuracy
+DISTRIBUTION_QUERY = """
+    SELECT D.year, C.industry, L.country, C.name,
+    P.minimum_salary, P.maximum_salary, P.minimum_experience, P.maximum_experience
+    FROM job_posting_fact F, job_posting_dim P, job_posting_date_dim D,
+    company_profile_dim C, job_location_dim L
+    WHERE F.job_posting_key = P.job_id AND
+    F.job_posting_date_key = D.job_posting_date_key AND
+    F.company_profile_key = C.company_profile_key AND
+    F.job_location_key = L.job_location_key;
+"""
+
+GROUPING_COLUMNS = {
+    "year": "D.year",
+    "industry": "C.industry",
+    "country": "L.country",
+    "company": "C.name",
+}
+
+
+class KLLSketch:
+    """
+    Mergeable quantile sketch (KLL) of a stream of numbers.
+
+    Values are kept in a hierarchy of compactors. Once a compactor is full,
+    it is sorted and every other value is promoted to the next compactor,
+    where each value stands for twice as many values of the stream. Memory
+    stays in O(k) while the rank of any returned quantile is off by at most
+    rank_error() of the stream size, with high probability.
+    """
+
+    def __init__(self, k: int = 200, seed: int = None):
+        """
+        Args:
+            k: accuracy parameter, a larger k gives a smaller error and a larger sketch
+            seed: seed of the coin flips made when compacting
+        """
+        self.k = k
+        self.count = 0
+        self.min: float = None
+        self.max: float = None
+        self._compactors: list[list[float]] = [[]]
+        self._random = random.Random(seed)
+        self._size = 0
+        self._max_size = self._capacity(0)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self._compactors) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _update_sizes(self):
+        self._size = sum(len(compactor) for compactor in self._compactors)
+        self._max_size = sum(self._capacity(level) for level in range(len(self._compactors)))
+
+    def update(self, value: float):
+        """
+        Add a value of the stream to the sketch.
+        """
+        value = float(value)
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self._compactors[0].append(value)
+        self._size += 1
+        if self._size > self._max_size:
+            self._compress()
+
+    def _compress(self):
+        self._update_sizes()
+        while self._size > self._max_size:
+            for level, compactor in enumerate(self._compactors):
+                if len(compactor) >= self._capacity(level):
+                    if level + 1 == len(self._compactors):
+                        self._compactors.append([])
+                    compactor.sort()
+                    # Keep the odd value out so that the total weight is preserved
+                    leftover = [compactor.pop()] if len(compactor) % 2 else []
+                    offset = self._random.randint(0, 1)
+                    self._compactors[level + 1].extend(compactor[offset::2])
+                    self._compactors[level] = leftover
+                    self._update_sizes()
+                    break
+
+    def merge(self, other: "KLLSketch"):
+        """
+        Add all values summarized by another sketch to this sketch.
+        """
+        if other.count == 0:
+            return
+        while len(self._compactors) < len(other._compactors):
+            self._compactors.append([])
+        for level, compactor in enumerate(other._compactors):
+            self._compactors[level].extend(compactor)
+        self.count += other.count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+
+    def _weighted_values(self) -> list[tuple[float, int]]:
+        return sorted(
+            (value, 2**level)
+            for level, compactor in enumerate(self._compactors)
+            for value in compactor
+        )
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate the q-quantile of the stream.
+
+        Args:
+            q: the quantile to estimate, between 0 and 1
+
+        Returns:
+            A value whose rank is within rank_error() of q, or None if the sketch is empty.
+        """
+        if self.count == 0:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        weighted_values = self._weighted_values()
+        total_weight = sum(weight for _, weight in weighted_values)
+        cumulative_weight = 0
+        for value, weight in weighted_values:
+            cumulative_weight += weight
+            if cumulative_weight >= q * total_weight:
+                return value
+        return self.max
+
+    def rank(self, value: float) -> float:
+        """
+        Estimate the fraction of the stream that is less than or equal to a value.
+        """
+        if self.count == 0:
+            return None
+        weighted_values = self._weighted_values()
+        total_weight = sum(weight for _, weight in weighted_values)
+        return sum(weight for v, weight in weighted_values if v <= value) / total_weight
+
+    def rank_error(self) -> float:
+        """
+        Normalized rank error bound of the sketch, at a 99% confidence.
+
+        Returns 0 while no value was compacted, since the sketch is exact.
+        """
+        if len(self._compactors) == 1:
+            return 0.0
+        # Empirical bound of KLL sketches for single quantile queries
+        return 2.446 / self.k**0.9433
+
+    def to_dict(self) -> dict:
+        return {
+            "k": self.k,
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "compactors": self._compactors,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "KLLSketch":
+        sketch = cls(k=data["k"])
+        sketch.count = data["count"]
+        sketch.min = data["min"]
+        sketch.max = data["max"]
+        sketch._compactors = data["compactors"]
+        sketch._update_sizes()
+        return sketch
+
+
+class Histogram:
+    """
+    Mergeable histogram of a stream of numbers with fixed width bins.
+    """
+
+    def __init__(self, bin_width: float):
+        self.bin_width = bin_width
+        self._bins: dict[int, int] = {}  # bin index -> count
+
+    def update(self, value: float):
+        index = int(math.floor(float(value) / self.bin_width))
+        self._bins[index] = self._bins.get(index, 0) + 1
+
+    def merge(self, other: "Histogram"):
+        for index, count in other._bins.items():
+            self._bins[index] = self._bins.get(index, 0) + count
+
+    def bins(self) -> list[tuple[float, float, int]]:
+        """
+        Returns:
+            (lower bound, upper bound, count) of each non empty bin, in increasing order.
+        """
+        return [
+            (index * self.bin_width, (index + 1) * self.bin_width, count)
+            for index, count in sorted(self._bins.items())
+        ]
+
+    def to_dict(self) -> dict:
+        return {"bin_width": self.bin_width, "bins": self._bins}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Histogram":
+        histogram = cls(data["bin_width"])
+        histogram._bins = {int(index): count for index, count in data["bins"].items()}
+        return histogram
+
+
+class DistributionSketches:
+    """
+    Quantile sketches and histograms of the salaries and experiences of the
+    job postings, for each group of every grouping in GROUPINGS.
+
+    Example:
+        sketches = load_sketches(conn)
+        sketches.quantile("year_industry", (2022, "Technology"), "maximum_salary", 0.5)
+        sketches.quantiles("year_country", "maximum_salary", 0.9)
+    """
+
+    def __init__(self, k: int = 200):
+        self.k = k
+        # grouping -> group key -> metric -> (sketch, histogram)
+        self._groups: dict[str, dict[tuple, dict[str, tuple[KLLSketch, Histogram]]]] = {
+            grouping: {} for grouping in GROUPINGS
+        }
+
+    def _summaries(self, grouping: str, key: tuple) -> dict:
+        summaries = self._groups[grouping].get(key)
+        if summaries is None:
+            summaries = {
+                metric: (KLLSketch(self.k), Histogram(bin_width))
+                for metric, bin_width in METRICS.items()
+            }
+            self._groups[grouping][key] = summaries
+        return summaries
+
+    def update(self, record: dict):
+        """
+        Add a job posting to the distributions of all the groups it belongs to.
+
+        Args:
+            record: the year, industry, country and company of the posting,
+                and its value for each column in METRICS
+        """
+        for grouping, attributes in GROUPINGS.items():
+            summaries = self._summaries(grouping, tuple(record[a] for a in attributes))
+            for metric in METRICS:
+                sketch, histogram = summaries[metric]
+                sketch.update(record[metric])
+                histogram.update(record[metric])
+
+    def update_from_fact_rows(self, fact_rows: list[tuple], lookups: dict[str, dict]):
+        """
+        Add freshly inserted fact table rows to the distributions.
+
+        Args:
+            fact_rows: rows of the fact table, in the column order of the insertion
+            lookups: attributes of the dimensions, see create_sketch_lookups()
+        """
+        for job_posting_key, company_profile_key, job_posting_date_key, _, _, job_location_key in fact_rows:
+            industry, company = lookups["company_profile"][company_profile_key]
+            record = {
+                "year": lookups["job_posting_date"][job_posting_date_key],
+                "industry": industry,
+                "country": lookups["job_location"][job_location_key],
+                "company": company,
+            }
+            record.update(zip(METRICS, lookups["job_posting"][job_posting_key]))
+            self.update(record)
+
+    def merge(self, other: "DistributionSketches"):
+        """
+        Add the distributions of another set of sketches, e.g. one built on another loader.
+        """
+        for grouping, groups in other._groups.items():
+            for key, other_summaries in groups.items():
+                summaries = self._summaries(grouping, key)
+                for metric, (other_sketch, other_histogram) in other_summaries.items():
+                    sketch, histogram = summaries[metric]
+                    sketch.merge(other_sketch)
+                    histogram.merge(other_histogram)
+
+    def groups(self, grouping: str) -> list[tuple]:
+        return sorted(self._groups[grouping], key=str)
+
+    def count(self, grouping: str, key: tuple, metric: str = "maximum_salary") -> int:
+        summaries = self._groups[grouping].get(tuple(key))
+        return summaries[metric][0].count if summaries else 0
+
+    def quantile(self, grouping: str, key: tuple, metric: str, q: float) -> float:
+        """
+        Estimate a quantile of a metric within a group.
+
+        Args:
+            grouping: one of GROUPINGS, e.g. "year_industry"
+            key: the group, e.g. (2022, "Technology")
+            metric: one of METRICS, e.g. "maximum_salary"
+            q: the quantile to estimate, e.g. 0.5 for the median
+
+        Returns:
+            The estimated quantile, or None if the group has no job postings.
+        """
+        summaries = self._groups[grouping].get(tuple(key))
+        return summaries[metric][0].quantile(q) if summaries else None
+
+    def quantiles(self, grouping: str, metric: str, q: float) -> dict[tuple, float]:
+        """
+        Estimate a quantile of a metric for every group of a grouping.
+        """
+        return {
+            key: summaries[metric][0].quantile(q)
+            for key, summaries in self._groups[grouping].items()
+        }
+
+    def histogram(self, grouping: str, key: tuple, metric: str) -> list[tuple[float, float, int]]:
+        """
+        Histogram of a metric within a group, see Histogram.bins().
+        """
+        summaries = self._groups[grouping].get(tuple(key))
+        return summaries[metric][1].bins() if summaries else []
+
+    def rank_error(self) -> float:
+        """
+        Largest normalized rank error bound of all the sketches.
+        """
+        return max(
+            (
+                sketch.rank_error()
+                for groups in self._groups.values()
+                for summaries in groups.values()
+                for sketch, _ in summaries.values()
+            ),
+            default=0.0,
+        )
+
+    def save(self, generation: int, path: str = SKETCH_PATH):
+        """
+        Save the sketches to a JSON file.
+
+        Args:
+            generation: the load generation the sketches are up to date with
+            path: where to save the sketches
+        """
+        data = {
+            "generation": generation,
+            "k": self.k,
+            "groups": {
+                grouping: [
+                    {
+                        "key": list(key),
+                        "metrics": {
+                            metric: {"sketch": sketch.to_dict(), "histogram": histogram.to_dict()}
+                            for metric, (sketch, histogram) in summaries.items()
+                        },
+                    }
+                    for key, summaries in groups.items()
+                ]
+                for grouping, groups in self._groups.items()
+            },
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def from_file(cls, path: str = SKETCH_PATH) -> tuple[int, "DistributionSketches"]:
+        """
+        Load sketches saved with save().
+
+        Returns:
+            The load generation the sketches are up to date with, and the sketches.
+        """
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        sketches = cls(k=data["k"])
+        for grouping, groups in data["groups"].items():
+            for group in groups:
+                sketches._groups[grouping][tuple(group["key"])] = {
+                    metric: (
+                        KLLSketch.from_dict(summary["sketch"]),
+                        Histogram.from_dict(summary["histogram"]),
+                    )
+                    for metric, summary in group["metrics"].items()
+                }
+        return data["generation"], sketches
+
+
+def create_sketch_lookups(
+    caches: dict[str, dict], conn, job_ids: list[int] = None
+) -> dict[str, dict]:
+    """
+    Create in-memory lookups of the dimension attributes needed by the sketches.
+
+    The dimension caches map the attributes of each dimension to its primary
+    key, so they are inverted to map the keys of inserted fact rows back to
+    their year, industry, country and company. Salaries and experiences are
+    fetched from job_posting_dim, which keeps the first version of a job
+    posting inserted, so the sketches see the same values as percentile_cont.
+
+    Args:
+        caches: the dimension caches, see create_dimension_caches()
+        conn: an open database connection
+        job_ids: the job postings about to be inserted in the fact table, all of them by default
+
+    Returns:
+        The lookups dictionary, keyed like the caches.
+    """
+    lookups = {
+        "company_profile": {
+            key: (industry, name)
+            for (name, _, industry, _, _), key in caches["company_profile"].items()
+        },
+        "job_posting_date": {
+            key: year for (_, _, year), key in caches["job_posting_date"].items()
+        },
+        "job_location": {
+            key: country for (country, _), key in caches["job_location"].items()
+        },
+        "job_posting": {},
+    }
+
+    query = f"SELECT job_id, {', '.join(METRICS)} FROM job_posting_dim"
+    with conn.cursor() as cur:
+        if job_ids is None:
+            cur.execute(f"{query};")
+        else:
+            cur.execute(f"{query} WHERE job_id = ANY(%s);", (list(job_ids),))
+        for job_id, *values in cur.fetchall():
+            lookups["job_posting"][job_id] = tuple(float(value) for value in values)
+
+    return lookups
+
+
+def build_sketches_from_database(conn, k: int = 200) -> DistributionSketches:
+    """
+    Build the sketches from scratch by scanning the whole fact table.
+    """
+    sketches = DistributionSketches(k)
+    with conn.cursor() as cur:
+        cur.execute(DISTRIBUTION_QUERY)
+        for year, industry, country, company, *values in cur.fetchall():
+            record = {"year": year, "industry": industry, "country": country, "company": company}
+            record.update(zip(METRICS, (float(value) for value in values)))
+            sketches.update(record)
+    return sketches
+
+
+def load_sketches(conn, path: str = SKETCH_PATH) -> DistributionSketches:
+    """
+    Load the sketches saved by the last load of the database.
+
+    The sketches are rebuilt from the fact table when the file is missing or
+    when it is not up to date with the current load generation (e.g. the
+    database was recreated), so that the inserts of the next load are never
+    counted on top of stale distributions.
+
+    Args:
+        conn: an open database connection
+        path: where the sketches were saved
+
+    Returns:
+        Sketches up to date with the database.
+    """
+    generation = get_load_generation(conn)
+    if os.path.exists(path):
+        saved_generation, sketches = DistributionSketches.from_file(path)
+        if saved_generation == generation:
+            return sketches
+    return build_sketches_from_database(conn)
+
+
+def compare_with_exact(
+    sketches: DistributionSketches, conn, grouping: str, metric: str, q: float
+) -> dict:
+    """
+    Measure the accuracy and the latency of the sketches against percentile_cont.
+
+    Args:
+        sketches: sketches up to date with the database
+        conn: an open database connection
+        grouping: one of GROUPINGS
+        metric: one of METRICS
+        q: the quantile to compare
+
+    Returns:
+        Latencies (in milliseconds) of the exact SQL and of the sketches, the
+        mean and max relative error of the estimated values, and the rank error bound.
+    """
+    group_columns = ", ".join(GROUPING_COLUMNS[a] for a in GROUPINGS[grouping])
+    exact_query = f"""
+        SELECT {group_columns}, percentile_cont(%s) WITHIN GROUP (ORDER BY P.{metric})
+        FROM job_posting_fact F, job_posting_dim P, job_posting_date_dim D,
+        company_profile_dim C, job_location_dim L
+        WHERE F.job_posting_key = P.job_id AND
+        F.job_posting_date_key = D.job_posting_date_key AND
+        F.company_profile_key = C.company_profile_key AND
+        F.job_location_key = L.job_location_key
+        GROUP BY {group_columns};
+    """
+
+    stopwatch = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.execute(exact_query, (q,))
+        exact = {tuple(row[:-1]): float(row[-1]) for row in cur.fetchall()}
+    exact_latency = time.perf_counter() - stopwatch
+
+    stopwatch = time.perf_counter()
+    estimated = sketches.quantiles(grouping, metric, q)
+    sketch_latency = time.perf_counter() - stopwatch
+
+    relative_errors = [
+        abs(estimated[key] - value) / abs(value) if value else abs(estimated[key])
+        for key, value in exact.items()
+        if estimated.get(key) is not None
+    ]
+
+    return {
+        "grouping": grouping,
+        "metric": metric,
+        "quantile": q,
+        "groups": len(exact),
+        "missing_groups": len(exact) - len(relative_errors),
+        "exact_latency_ms": 1000 * exact_latency,
+        "sketch_latency_ms": 1000 * sketch_latency,
+        "mean_relative_error": sum(relative_errors) / len(relative_errors) if relative_errors else 0.0,
+        "max_relative_error": max(relative_errors, default=0.0),
+        "rank_error_bound": sketches.rank_error(),
+    }
+
+
+if __name__ == "__main__":
+    # Report the accuracy and latency of the sketches against the exact SQL
+    conn = psycopg2.connect(**DB_PARAMS)
+    try:
+        sketches = load_sketches(conn)
+        for grouping in GROUPINGS:
+            for q in (0.5, 0.9):
+                print(compare_with_exact(sketches, conn, grouping, "maximum_salary", q))
+    finally:
+        conn.close()
@@ -0,0 +1,210 @@
+import ast
+import csv
+import json
+import re
+
+from datetime import date
+
+# Same transformations as data_staging/CSI4142_DataStaging_Group8.ipynb, applied
+# row by row so that raw job_descriptions.csv drops can be staged without pandas
+
+CITY_POPULATION_PATH = "./data_staging/CityPopulation.csv"
+COMPANY_INFORMATION_PATH = "./data_staging/CompanyInformation.csv"
+
+# Countries we keep for our analysis
+DESIRED_COUNTRIES = ['USA', 'UK', 'Canada', 'France', 'Japan', 'Belgium', 'Australia', 'Spain', 'India', 'Germany', 'Singapore', 'Thailand', 'China', 'Portugal', 'Vietnam', 'Mauritius']
+
+BENEFIT_COLUMNS = ['Retirement Plans','Stock Options or Equity Grants','Parental Leave','Paid Time Off (PTO)',
+                   'Flexible Work Arrangements','Health Insurance','Life and Disability Insurance',
+                   'Employee Assistance Program','Health and Wellness Facilities','Employee Referral Program',
+                   'Transportation Benefits','Bonuses and Incentive Programs']
+
+# Missing information for company profile
+MISSING_COMPANY_PROFILES = {
+    'Estée Lauder': {"Sector":"Consumer Goods","Industry":"Consumer Goods","City":"New York","State":"New York","Zip":"10001","Website":"www.elcompanies.com","Ticker":"EL","CEO":"Fabrizio Freda"},
+    'Dunkin\'Brands Group, Inc.': {"Sector":"Restaurants","Industry":"Food Services","City":"Canton","State":"Massachusetts","Zip":"02021","Website":"www.dunkindonuts.com","Ticker":"DNKN","CEO":"Nigel Travis"},
+    'Peter Kiewit Sons': {"Sector":"Construction/Infrastructure","Industry":"Construction/Infrastructure","City":"Omaha","State":"Nebraska","Zip":"68102","Website":"www.kiewit.com","Ticker":"N/A","CEO":"Rick Lanoha"},
+}
+
+# Keys to extract from the company profile and their column names
+COMPANY_PROFILE_COLUMNS = {
+    'Sector': 'Company Sector',
+    'Industry': 'Company Industry',
+    'City': 'Company HQ City',
+    'Ticker': 'Company Ticker'
+}
+
+# German cities whose special characters are not displayed
+HQ_CITY_REPLACEMENTS = {
+    'G ttingen': 'Göttingen',
+    'Bad Homburg vor der H he': 'Bad Homburg vor der Höhe',
+    'Unterf hring': 'Unterföhring',
+    'Unterschlei heim': 'Unterschleißheim',
+    'D sseldorf': 'Düsseldorf'
+}
+
+# Columns of the staged data, in the same order as Staged_data.csv
+STAGED_COLUMNS = ['Job Id','Minimum Experience (years)',
+                  'Maximum Experience (years)','Qualifications',
+                  'Minimum Salary', 'Maximum Salary', 'City', 'Country', 'Job City Population',
+                  'Work Type', 'Day', 'Month', 'Year', 'Gender Preference', 'Job Title', 'Specialization',
+                  'Job Portal', 'Skills', 'Responsibilities', 'Company', 'Company Size', 'Company Sector',
+                  'Company Industry', 'Company HQ City', 'Company HQ Country', 'Company Ticker',
+                  'Retirement Plans', 'Stock Options or Equity Grants', 'Parental Leave','Paid Time Off (PTO)',
+                  'Flexible Work Arrangements','Health Insurance', 'Life and Disability Insurance',
+                  'Employee Assistance Program','Health and Wellness Facilities','Employee Referral Program',
+                  'Transportation Benefits','Bonuses and Incentive Programs']
+
+
+def load_city_populations(csv_path: str = CITY_POPULATION_PATH) -> dict[tuple, int]:
+    """
+    Load the population of each job city.
+
+    Returns:
+        The population of each (city, country).
+    """
+    with open(csv_path, newline="", encoding="utf-8-sig") as csvfile:
+        return {
+            (row["City"], row["Country"]): int(row["City Population"].replace(",", ""))
+            for row in csv.DictReader(csvfile)
+        }
+
+
+def load_company_information(csv_path: str = COMPANY_INFORMATION_PATH) -> dict[str, tuple]:
+    """
+    Load the headquarters country location and size (number of employees) of each company.
+
+    Returns:
+        The (HQ country, size) of each company.
+    """
+    with open(csv_path, newline="", encoding="utf-8-sig") as csvfile:
+        return {
+            row["Company"]: (row["Country"], int(row["Company Size"]))
+            for row in csv.DictReader(csvfile)
+        }
+
+
+def extract_profile_value(dictionary_str: str, key: str) -> str:
+    """
+    Extract the value of a key from a company profile, e.g. {"Sector":"Diversified",...}
+
+    Returns:
+        The value of the key, or an empty string if it is missing or the profile is malformed.
+    """
+    try:
+        value = ast.literal_eval(dictionary_str).get(key, None)
+        return value if value is not None else ""
+    except (SyntaxError, ValueError, AttributeError):
+        return ""
+
+
+def _only_digits(value: str) -> int:
+    # Keep only integers, replace every non digit character by a ""
+    return int(re.sub(r"[^\d]", "", value))
+
+
+def stage_row(row: dict, populations: dict[tuple, int], companies: dict[str, tuple]) -> dict:
+    """
+    Transform a raw job posting into a staged row.
+
+    Args:
+        row: a row of a raw job_descriptions.csv file
+        populations: see load_city_populations()
+        companies: see load_company_information()
+
+    Returns:
+        The staged row, with the columns and string formatting of Staged_data.csv,
+        or None if the posting is filtered out or cannot be integrated.
+    """
+    # Keep only the countries we want for our analysis
+    if row["Country"] not in DESIRED_COUNTRIES:
+        return None
+
+    # Integrate the city population and the company information
+    population = populations.get((row["location"], row["Country"]))
+    company_information = companies.get(row["Company"])
+    if population is None or company_information is None:
+        return None
+
+    staged = {
+        "Job Id": str(int(row["Job Id"])),
+        "Qualifications": row["Qualifications"],
+        "City": row["location"],
+        "Country": row["Country"],
+        "Job City Population": str(population),
+        "Work Type": row["Work Type"],
+        "Gender Preference": row["Preference"],
+        "Job Title": row["Job Title"],
+        "Specialization": row["Role"],
+        "Job Portal": row["Job Portal"],
+        "Skills": row["skills"],
+        "Responsibilities": row["Responsibilities"],
+        "Company": row["Company"],
+        "Company HQ Country": company_information[0],
+        "Company Size": str(company_information[1]),
+    }
+
+    # Extract the day, month and year from job posting date
+    posting_date = date.fromisoformat(row["Job Posting Date"])
+    staged["Day"] = str(posting_date.day)
+    staged["Month"] = str(posting_date.month)
+    staged["Year"] = str(posting_date.year)
+
+    # Split salary range in to minimum salary and maximum salary, in $ instead of in thousands unit
+    minimum_salary, maximum_salary = row["Salary Range"].split("-")
+    staged["Minimum Salary"] = str(_only_digits(minimum_salary) * 1000)
+    staged["Maximum Salary"] = str(_only_digits(maximum_salary) * 1000)
+
+    # Split Years of experience range in to minimum experience and maximum experience
+    minimum_experience, maximum_experience = row["Experience"].split("to")
+    staged["Minimum Experience (years)"] = str(_only_digits(minimum_experience))
+    staged["Maximum Experience (years)"] = str(_only_digits(maximum_experience))
+
+    # Handling missing values and incorrectly formatted data for company profile
+    company_profile = row["Company Profile"]
+    if not company_profile and row["Company"] in MISSING_COMPANY_PROFILES:
+        company_profile = json.dumps(MISSING_COMPANY_PROFILES[row["Company"]])
+    if row["Company"] == "Quanta Services":
+        company_profile = company_profile.replace('"Duke" Austin', 'Austin')
+
+    for key, new_key in COMPANY_PROFILE_COLUMNS.items():
+        staged[new_key] = extract_profile_value(company_profile, key)
+
+    # Keep only the city when the HQ city also includes the country, e.g. "London, UK"
+    split_city = staged["Company HQ City"].split(",")
+    if len(split_city) == 2:
+        staged["Company HQ City"] = split_city[0]
+    for broken, fixed in HQ_CITY_REPLACEMENTS.items():
+        staged["Company HQ City"] = staged["Company HQ City"].replace(broken, fixed)
+
+    if staged["Company Ticker"] == "N/A":
+        staged["Company Ticker"] = ""
+
+    # One column for each benefit
+    for column in BENEFIT_COLUMNS:
+        staged[column] = str(column in row["Benefits"])
+
+    return {column: staged[column] for column in STAGED_COLUMNS}
+
+
+def stage_rows(
+    raw_rows, populations: dict[tuple, int], companies: dict[str, tuple]
+) -> tuple[list[dict], int]:
+    """
+    Transform raw job postings into staged rows, see stage_row().
+
+    Returns:
+        The staged rows, and the number of raw rows that were filtered out or rejected.
+    """
+    staged_rows = []
+    rejected = 0
+    for row in raw_rows:
+        try:
+            staged = stage_row(row, populations, companies)
+        except (KeyError, ValueError, TypeError, AttributeError):  # malformed raw row
+            staged = None
+        if staged is None:
+            rejected += 1
+        else:
+            staged_rows.append(staged)
+    return staged_rows, rejected
@@ -0,0 +1,65 @@
+import csv
+import os
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(ROOT_DIR, "tests", "fixtures")
+
+# The db scripts import each other by module name, as when run with `python db/<script>.py`
+sys.path.insert(0, os.path.join(ROOT_DIR, "db"))
+
+from staging import (  # noqa: E402
+    STAGED_COLUMNS,
+    load_city_populations,
+    load_company_information,
+    stage_rows,
+)
+
+
+def read_fixture(file_name: str) -> list[dict]:
+    with open(os.path.join(FIXTURES_DIR, file_name), newline="", encoding="utf-8") as csvfile:
+        return list(csv.DictReader(csvfile))
+
+
+class StageRowsTest(unittest.TestCase):
+    """
+    Check db/staging.py against the transformations of data_staging/CSI4142_DataStaging_Group8.ipynb.
+
+    job_descriptions_sample.csv holds raw job postings covering the special cases
+    of the notebook (missing and malformed company profiles, HQ cities with a
+    country or broken characters, N/A tickers, benefits), and
+    staged_data_sample.csv the rows the notebook stages them into.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.populations = load_city_populations(
+            os.path.join(ROOT_DIR, "data_staging", "CityPopulation.csv")
+        )
+        cls.companies = load_company_information(
+            os.path.join(ROOT_DIR, "data_staging", "CompanyInformation.csv")
+        )
+        cls.raw_rows = read_fixture("job_descriptions_sample.csv")
+        cls.expected_rows = read_fixture("staged_data_sample.csv")
+
+    def test_rows_match_notebook(self):
+        rows, _ = stage_rows(self.raw_rows, self.populations, self.companies)
+        self.assertEqual(len(rows), len(self.expected_rows))
+        for row, expected in zip(rows, self.expected_rows):
+            with self.subTest(job_id=expected["Job Id"]):
+                self.assertEqual(row, expected)
+
+    def test_columns_in_staged_order(self):
+        rows, _ = stage_rows(self.raw_rows, self.populations, self.companies)
+        for row in rows:
+            self.assertEqual(list(row), STAGED_COLUMNS)
+
+    def test_filtered_and_malformed_rows_are_rejected(self):
+        # A country outside of the analysis, a city without population and a malformed job id
+        _, rejected = stage_rows(self.raw_rows, self.populations, self.companies)
+        self.assertEqual(rejected, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()